@@ -0,0 +1,80 @@
+"""
+Batch Wildlife Classification
+Classifies every image in the given files / directories and stores the
+predictions in the columnar results store
+"""
+
+import argparse
+import os
+
+from siamese_network import WildlifeRecognitionModel, TTA_VIEW_SETS
+from results_store import ResultsStore, default_results_dir
+
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".gif", ".webp", ".tiff", ".tif", ".jfif"}
+
+
+def find_images(paths):
+    """
+    Expand files and directories (recursively) into image file paths
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, _, filenames in os.walk(path):
+                for filename in sorted(filenames):
+                    if os.path.splitext(filename)[1].lower() in IMAGE_EXTENSIONS:
+                        yield os.path.join(dirpath, filename)
+        else:
+            yield path
+
+
+def classify_images(model, store, image_paths, batch_size=32, top_k=5, tta=None):
+    """
+    Classify images in batches and append the predictions to the store
+    Returns the number of images stored
+    """
+    batch = []
+    stored = 0
+    for image_path in image_paths:
+        batch.append(image_path)
+        if len(batch) == batch_size:
+            stored += _classify_batch(model, store, batch, top_k, tta)
+            batch = []
+    if batch:
+        stored += _classify_batch(model, store, batch, top_k, tta)
+    return stored
+
+
+def _classify_batch(model, store, batch, top_k, tta):
+    """
+    Run one batch through the model and append its predictions
+    """
+    for image_path, predictions in zip(batch, model.predict_batch(batch, top_k=top_k, tta=tta)):
+        store.append(image_path, predictions)
+    return len(batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classify images into the results store")
+    parser.add_argument("paths", nargs="+", help="Image files or directories")
+    parser.add_argument("--results-dir", default=default_results_dir(),
+                        help="Results store directory")
+    parser.add_argument("--batch-size", type=int, default=32,
+                        help="Images per forward pass")
+    parser.add_argument("--tta", choices=sorted(TTA_VIEW_SETS), default=None,
+                        help="Test-time augmentation view set")
+    args = parser.parse_args()
+
+    model = WildlifeRecognitionModel()
+    with ResultsStore(args.results_dir) as store:
+        stored = classify_images(model, store, find_images(args.paths),
+                                 batch_size=args.batch_size, tta=args.tta)
+
+    # Merge any small chunks left by earlier runs or the GUI
+    store.compact()
+
+    print(f"Stored predictions for {stored} image(s) in {args.results_dir}")
+
+
+if __name__ == "__main__":
+    main()
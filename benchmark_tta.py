@@ -0,0 +1,58 @@
+"""
+Benchmark for test-time augmentation (TTA) view sets
+Measures prediction latency per view set and the cost of each added view
+"""
+
+import argparse
+import os
+import time
+
+from siamese_network import WildlifeRecognitionModel, TTA_VIEW_SETS
+
+
+# Sample images shipped with the repository
+IMAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_IMAGES = [
+    os.path.join(IMAGE_DIR, name)
+    for name in ["Lion.jpeg", "Eagle.jpeg", "Male Elephant.jpeg", "Test1.jpeg"]
+]
+
+
+def time_predict(model, image_paths, tta, repeats):
+    """
+    Return the mean seconds per image for one TTA option
+    """
+    # Warm-up run (builds transforms, initialises kernels)
+    model.predict_batch(image_paths, tta=tta)
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        model.predict_batch(image_paths, tta=tta)
+    elapsed = time.perf_counter() - start
+
+    return elapsed / (repeats * len(image_paths))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark TTA view sets")
+    parser.add_argument("images", nargs="*", default=DEFAULT_IMAGES,
+                        help="Images to classify as one batch")
+    parser.add_argument("--repeats", type=int, default=10,
+                        help="Timed runs per view set")
+    args = parser.parse_args()
+
+    model = WildlifeRecognitionModel()
+    print(f"Device: {model.device}, batch of {len(args.images)} image(s)")
+
+    baseline = time_predict(model, args.images, None, args.repeats)
+    print(f"{'view set':<18}{'views':>6}{'ms/image':>12}{'ms/added view':>16}")
+
+    for name, views in TTA_VIEW_SETS.items():
+        per_image = time_predict(model, args.images, name, args.repeats)
+        added = len(views) - 1
+        per_view = (per_image - baseline) / added if added else 0.0
+        print(f"{name:<18}{len(views):>6}{per_image * 1000:>12.2f}{per_view * 1000:>16.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,589 @@
+"""
+Columnar Results Store for Wildlife Predictions
+Persists predictions in chunked NumPy columns with a per-chunk index
+for fast species / confidence / capture-time queries
+"""
+
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import numpy as np
+from PIL import Image
+
+from siamese_network import IMAGENET_WILDLIFE_CLASSES
+
+
+# Species are dictionary-encoded by their ImageNet class index
+SPECIES_TO_CLASS_IDX = {name: idx for idx, name in IMAGENET_WILDLIFE_CLASSES.items()}
+UNKNOWN_SPECIES = -1
+
+# EXIF tags for capture time
+EXIF_IFD_POINTER = 0x8769
+EXIF_DATETIME_ORIGINAL = 36867
+EXIF_DATETIME = 306
+
+MANIFEST_NAME = "manifest.json"
+LOCK_NAME = "manifest.lock"
+# The lock is only held while the manifest is read and rewritten. Waiting
+# longer than the stale threshold means an abandoned lock is always broken
+# before a writer gives up.
+STALE_LOCK_SECONDS = 30.0
+LOCK_TIMEOUT = 60.0
+# Chunks replaced by compact() stay on disk this long so queries that
+# snapshotted the old manifest can still read them
+RETIRED_GRACE_SECONDS = 600.0
+COLUMNS = ("image_index", "species", "confidence", "rank", "captured_at")
+NAT = np.datetime64("NaT", "s")
+
+
+def encode_species(label):
+    """
+    Map a prediction label to its species code
+    Handles the "Class N" labels of the general-prediction fallback
+    """
+    if label in SPECIES_TO_CLASS_IDX:
+        return SPECIES_TO_CLASS_IDX[label]
+    if label.startswith("Class ") and label[6:].isdigit():
+        return int(label[6:])
+    return UNKNOWN_SPECIES
+
+
+def species_query_code(name):
+    """
+    Map a species name used in a query to its code
+    Raises ValueError for names that do not resolve; "Unknown" must be
+    passed explicitly to match rows with unrecognised labels
+    """
+    if name == "Unknown":
+        return UNKNOWN_SPECIES
+    code = encode_species(name)
+    if code == UNKNOWN_SPECIES:
+        raise ValueError(f"Unknown species name '{name}'")
+    return code
+
+
+def decode_species(code):
+    """
+    Map a species code back to its label
+    """
+    code = int(code)
+    if code in IMAGENET_WILDLIFE_CLASSES:
+        return IMAGENET_WILDLIFE_CLASSES[code]
+    if code == UNKNOWN_SPECIES:
+        return "Unknown"
+    return f"Class {code}"
+
+
+def read_capture_time(image_path):
+    """
+    Read the EXIF capture timestamp of an image
+    Returns a numpy datetime64 (seconds), or NaT if unavailable
+    """
+    try:
+        with Image.open(image_path) as image:
+            exif = image.getexif()
+            value = exif.get_ifd(EXIF_IFD_POINTER).get(EXIF_DATETIME_ORIGINAL)
+            if value is None:
+                value = exif.get(EXIF_DATETIME)
+        if value is None:
+            return NAT
+        if isinstance(value, bytes):
+            value = value.decode("ascii", errors="ignore")
+        captured = datetime.strptime(value.strip("\x00 "), "%Y:%m:%d %H:%M:%S")
+        return np.datetime64(captured, "s")
+    except (OSError, ValueError):
+        return NAT
+
+
+def default_results_dir():
+    """
+    Per-user data directory for stored results
+    Windows: %LOCALAPPDATA%, macOS: ~/Library/Application Support,
+    Linux: $XDG_DATA_HOME (default ~/.local/share)
+    """
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~\\AppData\\Local")
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Application Support")
+    else:
+        base = os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share")
+    return os.path.join(base, "WildlifeRecognition", "results")
+
+
+def _to_datetime64(value):
+    """
+    Convert a query bound (datetime / string / datetime64) to datetime64[s]
+    """
+    if value is None:
+        return None
+    return np.datetime64(value, "s")
+
+
+class ResultsStore:
+    """
+    Append-only columnar store of prediction results
+
+    Rows (one per image and prediction rank) are buffered in memory and
+    written in chunks; each chunk is a directory of .npy column files.
+    A manifest keeps per-chunk statistics so queries can skip chunks and
+    species counts can be answered without reading any column data.
+
+    Several writers (processes or store instances) may share one root:
+    chunk names are unique and the manifest is re-read and merged under
+    a lock file every time a chunk is added. compact() merges small
+    chunks so the chunk count stays proportional to rows / chunk_size.
+    """
+    def __init__(self, root, chunk_size=65536):
+        self.root = root
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self._reset_buffer()
+
+        os.makedirs(self.root, exist_ok=True)
+
+    def _reset_buffer(self):
+        """
+        Clear the in-memory row buffer
+        """
+        self._image_paths = []
+        self._rows = {column: [] for column in COLUMNS}
+
+    def _load_manifest(self):
+        """
+        Load the chunk manifest, or start an empty one
+        """
+        path = os.path.join(self.root, MANIFEST_NAME)
+        if not os.path.exists(path):
+            return {"chunks": [], "retired": []}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_manifest(self, manifest):
+        """
+        Atomically write the chunk manifest
+        """
+        path = os.path.join(self.root, MANIFEST_NAME)
+        tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, path)
+
+    def _acquire_manifest_lock(self):
+        """
+        Take the cross-process manifest lock file
+        A lock older than STALE_LOCK_SECONDS is assumed abandoned and removed
+        """
+        path = os.path.join(self.root, LOCK_NAME)
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while True:
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, str(os.getpid()).encode("ascii"))
+                os.close(fd)
+                return path
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(path) > STALE_LOCK_SECONDS:
+                        os.remove(path)
+                        continue
+                except OSError:
+                    continue
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Could not lock results manifest: {path}")
+                time.sleep(0.05)
+
+    def _update_manifest(self, update):
+        """
+        Re-read the manifest, apply update(manifest) and write it back under the lock
+        Returns whatever update() returns; nothing is written if it raises
+        """
+        lock_path = self._acquire_manifest_lock()
+        try:
+            manifest = self._load_manifest()
+            manifest.setdefault("retired", [])
+            result = update(manifest)
+            self._save_manifest(manifest)
+            return result
+        finally:
+            os.remove(lock_path)
+
+    def append(self, image_path, predictions, captured_at=None):
+        """
+        Buffer the predictions for one image
+        predictions: list of (species_name, confidence) as returned by predict()
+        captured_at: capture time; read from EXIF when not given
+        """
+        if captured_at is None:
+            captured_at = read_capture_time(image_path)
+        captured_at = np.datetime64(captured_at, "s")
+
+        with self._lock:
+            image_index = len(self._image_paths)
+            self._image_paths.append(image_path)
+
+            for rank, (species, confidence) in enumerate(predictions):
+                self._rows["image_index"].append(image_index)
+                self._rows["species"].append(encode_species(species))
+                self._rows["confidence"].append(confidence)
+                self._rows["rank"].append(rank)
+                self._rows["captured_at"].append(captured_at)
+
+            if len(self._rows["species"]) >= self.chunk_size:
+                self._flush_locked()
+
+    def flush(self):
+        """
+        Write all buffered rows to a new chunk
+        """
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        """
+        Write buffered rows to disk (caller holds the lock)
+        """
+        if not self._rows["species"]:
+            return
+
+        columns, image_paths = self._buffer_columns()
+        stats = self._write_chunk(columns, image_paths)
+        try:
+            self._update_manifest(lambda manifest: manifest["chunks"].append(stats))
+        except BaseException:
+            # Leave no orphan chunk behind; the rows stay buffered for a retry
+            shutil.rmtree(os.path.join(self.root, stats["name"]), ignore_errors=True)
+            raise
+
+        self._reset_buffer()
+
+    def _write_chunk(self, columns, image_paths):
+        """
+        Write one chunk directory (not yet listed in the manifest)
+        Returns the chunk's manifest entry
+        """
+        # Unique per writer, so concurrent writers never share a chunk directory
+        name = f"chunk_{time.strftime('%Y%m%d%H%M%S')}_{os.getpid()}_{uuid.uuid4().hex[:8]}"
+        tmp_dir = os.path.join(self.root, name + ".tmp")
+        try:
+            os.makedirs(tmp_dir)
+            for column, values in columns.items():
+                np.save(os.path.join(tmp_dir, f"{column}.npy"), values)
+            np.save(os.path.join(tmp_dir, "image_path.npy"), image_paths)
+            os.rename(tmp_dir, os.path.join(self.root, name))
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        return self._chunk_stats(name, columns)
+
+    def _read_chunk(self, chunk):
+        """
+        Load all columns of a chunk into memory
+        Returns (columns, image_paths)
+        """
+        chunk_dir = os.path.join(self.root, chunk["name"])
+        columns = {column: np.load(os.path.join(chunk_dir, f"{column}.npy")) for column in COLUMNS}
+        return columns, np.load(os.path.join(chunk_dir, "image_path.npy"))
+
+    def _merge_chunks(self, chunks):
+        """
+        Concatenate several chunks into one, sorted by capture time
+        Sorting keeps each merged chunk's time range tight for pruning
+        """
+        parts = [self._read_chunk(chunk) for chunk in chunks]
+
+        offset = 0
+        image_index = []
+        for columns, image_paths in parts:
+            image_index.append(columns["image_index"] + offset)
+            offset += len(image_paths)
+
+        columns = {
+            column: np.concatenate([part[0][column] for part in parts])
+            for column in COLUMNS if column != "image_index"
+        }
+        columns["image_index"] = np.concatenate(image_index).astype(np.int32)
+        image_paths = np.concatenate([part[1] for part in parts])
+
+        # NaT sorts last
+        order = np.argsort(columns["captured_at"], kind="stable")
+        return {column: values[order] for column, values in columns.items()}, image_paths
+
+    def compact(self, target_rows=None, min_chunks=2):
+        """
+        Merge chunks smaller than target_rows into chunks of up to target_rows rows
+        target_rows defaults to chunk_size; writers that flush small chunks
+        for durability pass a larger target. Only runs when at least
+        min_chunks small chunks exist. Replaced chunks are deleted after
+        RETIRED_GRACE_SECONDS, so running queries can finish.
+        Returns the number of chunks that were merged away
+        """
+        target_rows = target_rows or self.chunk_size
+        manifest = self._load_manifest()
+        small = [chunk for chunk in manifest["chunks"] if chunk["rows"] < target_rows]
+
+        # Group whole chunks greedily so an image's rows never straddle chunks
+        groups = []
+        group, group_rows = [], 0
+        for chunk in small:
+            if group and group_rows + chunk["rows"] > target_rows:
+                groups.append(group)
+                group, group_rows = [], 0
+            group.append(chunk)
+            group_rows += chunk["rows"]
+        groups.append(group)
+        groups = [group for group in groups if len(group) > 1]
+
+        if len(small) < min_chunks or not groups:
+            self._purge_retired()
+            return 0
+
+        new_chunks = []
+        try:
+            for group in groups:
+                new_chunks.append(self._write_chunk(*self._merge_chunks(group)))
+        except BaseException:
+            for stats in new_chunks:
+                shutil.rmtree(os.path.join(self.root, stats["name"]), ignore_errors=True)
+            raise
+
+        merged = {chunk["name"] for group in groups for chunk in group}
+        now = time.time()
+
+        def replace(manifest):
+            current = {chunk["name"] for chunk in manifest["chunks"]}
+            if not merged <= current:
+                # Another process compacted these chunks first
+                return False
+            manifest["chunks"] = [
+                chunk for chunk in manifest["chunks"] if chunk["name"] not in merged
+            ] + new_chunks
+            manifest["retired"].extend({"name": name, "retired_at": now} for name in sorted(merged))
+            return True
+
+        replaced = False
+        try:
+            replaced = self._update_manifest(replace)
+        finally:
+            if not replaced:
+                for stats in new_chunks:
+                    shutil.rmtree(os.path.join(self.root, stats["name"]), ignore_errors=True)
+
+        self._purge_retired()
+        return len(merged) if replaced else 0
+
+    def _purge_retired(self):
+        """
+        Delete chunks retired by compact() more than RETIRED_GRACE_SECONDS ago
+        """
+        cutoff = time.time() - RETIRED_GRACE_SECONDS
+
+        def take_expired(manifest):
+            expired = [entry["name"] for entry in manifest["retired"] if entry["retired_at"] < cutoff]
+            manifest["retired"] = [entry for entry in manifest["retired"] if entry["retired_at"] >= cutoff]
+            return expired
+
+        if not any(entry["retired_at"] < cutoff for entry in self._load_manifest().get("retired", [])):
+            return
+        for name in self._update_manifest(take_expired):
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+    def _buffer_columns(self):
+        """
+        Convert the buffered rows to column arrays (caller holds the lock)
+        Returns (columns, image_paths)
+        """
+        columns = {
+            "image_index": np.asarray(self._rows["image_index"], dtype=np.int32),
+            "species": np.asarray(self._rows["species"], dtype=np.int16),
+            "confidence": np.asarray(self._rows["confidence"], dtype=np.float32),
+            "rank": np.asarray(self._rows["rank"], dtype=np.uint8),
+            "captured_at": np.asarray(self._rows["captured_at"], dtype="datetime64[s]"),
+        }
+        return columns, np.asarray(self._image_paths, dtype=str)
+
+    def _chunk_stats(self, name, columns):
+        """
+        Compute the manifest entry used to prune and count a chunk
+        """
+        times = columns["captured_at"]
+        valid_times = times[~np.isnat(times)]
+        top1 = columns["species"][columns["rank"] == 0]
+        codes, counts = np.unique(top1, return_counts=True)
+
+        return {
+            "name": name,
+            "rows": int(len(columns["species"])),
+            "species": sorted(int(code) for code in np.unique(columns["species"])),
+            "max_confidence": float(columns["confidence"].max()),
+            "min_time": str(valid_times.min()) if len(valid_times) else None,
+            "max_time": str(valid_times.max()) if len(valid_times) else None,
+            "top1_counts": {str(int(code)): int(count) for code, count in zip(codes, counts)},
+        }
+
+    def _chunk_may_match(self, chunk, species_codes, min_confidence, start, end):
+        """
+        Decide from manifest statistics whether a chunk can hold matches
+        """
+        if species_codes is not None and not species_codes.intersection(chunk["species"]):
+            return False
+        if min_confidence is not None and chunk["max_confidence"] < min_confidence:
+            return False
+        if start is not None or end is not None:
+            if chunk["min_time"] is None:
+                return False
+            if start is not None and np.datetime64(chunk["max_time"], "s") < start:
+                return False
+            if end is not None and np.datetime64(chunk["min_time"], "s") >= end:
+                return False
+        return True
+
+    def _load_column(self, chunk, column):
+        """
+        Memory-map one column of a chunk
+        """
+        path = os.path.join(self.root, chunk["name"], f"{column}.npy")
+        return np.load(path, mmap_mode="r")
+
+    def _row_mask(self, load, rows, species_codes, min_confidence, start, end, top_only):
+        """
+        Build the boolean row mask of a chunk, reading only filtered columns
+        load: callable returning one column array by name
+        """
+        mask = np.ones(rows, dtype=bool)
+        if top_only:
+            mask &= load("rank") == 0
+        if species_codes is not None:
+            mask &= np.isin(load("species"), np.fromiter(species_codes, dtype=np.int16))
+        if min_confidence is not None:
+            mask &= load("confidence") >= min_confidence
+        if start is not None or end is not None:
+            times = load("captured_at")
+            mask &= ~np.isnat(times)
+            if start is not None:
+                mask &= times >= start
+            if end is not None:
+                mask &= times < end
+        return mask
+
+    def _sources(self):
+        """
+        Snapshot every chunk on disk and the in-memory buffer together
+        Both are read under the store lock, which flushes also hold, so rows
+        being flushed are seen exactly once (in the buffer or in a chunk).
+        Returns a list of (stats, load, image_paths_loader); stats is None
+        for the buffer
+        """
+        with self._lock:
+            chunks = self._load_manifest()["chunks"]
+            snapshot = self._buffer_columns() if self._rows["species"] else None
+
+        sources = [
+            (
+                chunk,
+                lambda column, chunk=chunk: self._load_column(chunk, column),
+                lambda chunk=chunk: np.load(os.path.join(self.root, chunk["name"], "image_path.npy")),
+            )
+            for chunk in chunks
+        ]
+        if snapshot is not None:
+            columns, image_paths = snapshot
+            sources.append((None, columns.__getitem__, lambda: image_paths))
+        return sources
+
+    def scan(self, species=None, min_confidence=None, start=None, end=None, top_only=True):
+        """
+        Iterate over stored predictions matching the given filters
+        Rows still buffered in memory are included without being flushed
+        species: species name or list of names (ValueError if unrecognised;
+                 pass "Unknown" to match unrecognised prediction labels)
+        min_confidence: minimum confidence percentage
+        start / end: capture time range [start, end); start is inclusive,
+                     end is exclusive, e.g. start="2024-01-01", end="2025-01-01"
+                     selects all of 2024
+        top_only: only consider each image's top-1 prediction
+        Yields (image_path, species_name, confidence, captured_at) tuples
+        """
+        species_codes = None
+        if species is not None:
+            if isinstance(species, str):
+                species = [species]
+            species_codes = {species_query_code(name) for name in species}
+        start = _to_datetime64(start)
+        end = _to_datetime64(end)
+
+        for stats, load, load_image_paths in self._sources():
+            if stats is not None:
+                if not self._chunk_may_match(stats, species_codes, min_confidence, start, end):
+                    continue
+                num_rows = stats["rows"]
+            else:
+                num_rows = len(load("species"))
+
+            mask = self._row_mask(load, num_rows, species_codes, min_confidence, start, end, top_only)
+            rows = np.flatnonzero(mask)
+            if len(rows) == 0:
+                continue
+
+            image_paths = load_image_paths()
+            image_index = load("image_index")[rows]
+            species_col = load("species")[rows]
+            confidence = load("confidence")[rows]
+            captured_at = load("captured_at")[rows]
+
+            for i in range(len(rows)):
+                yield (
+                    str(image_paths[image_index[i]]),
+                    decode_species(species_col[i]),
+                    float(confidence[i]),
+                    captured_at[i],
+                )
+
+    def species_counts(self, min_confidence=None, start=None, end=None):
+        """
+        Count images per top-1 species, including rows not yet flushed
+        start / end: capture time range [start, end), as in scan()
+        Without filters the on-disk counts come straight from the manifest
+        Returns a dict of species_name -> count, most frequent first
+        """
+        start = _to_datetime64(start)
+        end = _to_datetime64(end)
+        unfiltered = min_confidence is None and start is None and end is None
+        totals = {}
+
+        for stats, load, _ in self._sources():
+            if stats is not None:
+                if unfiltered:
+                    for code, count in stats["top1_counts"].items():
+                        totals[int(code)] = totals.get(int(code), 0) + count
+                    continue
+                if not self._chunk_may_match(stats, None, min_confidence, start, end):
+                    continue
+                num_rows = stats["rows"]
+            else:
+                num_rows = len(load("species"))
+
+            mask = self._row_mask(load, num_rows, None, min_confidence, start, end, top_only=True)
+            codes, counts = np.unique(load("species")[mask], return_counts=True)
+            for code, count in zip(codes, counts):
+                totals[int(code)] = totals.get(int(code), 0) + int(count)
+
+        ordered = sorted(totals.items(), key=lambda x: x[1], reverse=True)
+        return {decode_species(code): count for code, count in ordered}
+
+    def close(self):
+        """
+        Flush any buffered rows
+        """
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
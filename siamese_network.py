@@ -166,6 +166,21 @@ IMAGENET_WILDLIFE_CLASSES = {
 }
 
 
+# Test-time augmentation view sets: lists of (resize, hflip) views.
+# Each view is resized to `resize` on the shorter side, center-cropped
+# to 224x224 and optionally flipped horizontally. 256 is the standard view.
+TTA_VIEW_SETS = {
+    "none": [(256, False)],
+    "flip": [(256, False), (256, True)],
+    "multiscale": [(224, False), (256, False), (288, False)],
+    "flip_multiscale": [
+        (224, False), (224, True),
+        (256, False), (256, True),
+        (288, False), (288, True),
+    ],
+}
+
+
 class WildlifeRecognitionModel:
     """
     Wildlife Recognition using Pretrained ResNet18 ImageNet Classifier
@@ -187,6 +202,9 @@ class WildlifeRecognitionModel:
                               std=[0.229, 0.224, 0.225])
         ])
 
+        # Extra preprocessing pipelines for TTA scales (built on demand)
+        self._scale_transforms = {}
+
         # Load ImageNet class labels
         self.imagenet_classes = self._load_imagenet_classes()
 
@@ -206,21 +224,120 @@ class WildlifeRecognitionModel:
         image_tensor = self.transform(image).unsqueeze(0)
         return image_tensor.to(self.device)
 
-    def predict(self, image_path, top_k=5):
+    def _get_scale_transform(self, resize):
+        """
+        Get (and cache) the preprocessing pipeline for one TTA scale
+        """
+        if resize == 256:
+            return self.transform
+
+        if resize not in self._scale_transforms:
+            self._scale_transforms[resize] = transforms.Compose([
+                transforms.Resize(resize),
+                transforms.CenterCrop(224),
+                transforms.ToTensor(),
+                transforms.Normalize(mean=[0.485, 0.456, 0.406],
+                                  std=[0.229, 0.224, 0.225])
+            ])
+        return self._scale_transforms[resize]
+
+    def preprocess_views(self, image_paths, views):
+        """
+        Build every augmented view of every image as a single batch tensor
+        Returns a tensor of shape (num_images * num_views, 3, 224, 224)
+        """
+        view_tensors = []
+        for image_path in image_paths:
+            image = Image.open(image_path).convert('RGB')
+
+            # Each scale is resized once; flipped views reuse that tensor
+            scaled = {}
+            for resize, hflip in views:
+                if resize not in scaled:
+                    scaled[resize] = self._get_scale_transform(resize)(image)
+                view = scaled[resize]
+                if hflip:
+                    view = torch.flip(view, dims=[-1])
+                view_tensors.append(view)
+
+        return torch.stack(view_tensors).to(self.device)
+
+    def predict(self, image_path, top_k=5, tta=None):
         """
         Predict species for an input image using ImageNet classification
         Returns top-k predictions with confidence scores
+
+        tta: optional view set name from TTA_VIEW_SETS or a list of
+             (resize, hflip) views; probabilities are averaged over views
         """
-        # Preprocess image
-        image_tensor = self.preprocess_image(image_path)
+        if tta is None:
+            # Preprocess image
+            image_tensor = self.preprocess_image(image_path)
+
+            # Get predictions
+            with torch.no_grad():
+                outputs = self.model(image_tensor)
+                probabilities = F.softmax(outputs, dim=1)
+
+            return self._filter_wildlife(probabilities[0], top_k)
 
-        # Get predictions
-        with torch.no_grad():
-            outputs = self.model(image_tensor)
-            probabilities = F.softmax(outputs, dim=1)
+        return self.predict_batch([image_path], top_k=top_k, tta=tta)[0]
 
+    def predict_batch(self, image_paths, top_k=5, tta=None, batch_size=None):
+        """
+        Predict species for several images with batched forward passes
+        Returns one top-k prediction list per image
+
+        batch_size: optional maximum number of images per forward pass;
+                    all views of an image always stay in the same pass
+        """
+        image_paths = list(image_paths)
+        if not image_paths:
+            return []
+        if batch_size is not None and batch_size < 1:
+            raise ValueError("batch_size must be a positive integer")
+
+        views = self._resolve_views(tta)
+        step = batch_size or len(image_paths)
+
+        predictions = []
+        for start in range(0, len(image_paths), step):
+            batch_paths = image_paths[start:start + step]
+            image_tensor = self.preprocess_views(batch_paths, views)
+
+            with torch.no_grad():
+                outputs = self.model(image_tensor)
+                probabilities = F.softmax(outputs, dim=1)
+
+            # Average probabilities over the views of each image
+            probabilities = probabilities.view(len(batch_paths), len(views), -1).mean(dim=1)
+
+            predictions.extend(self._filter_wildlife(probs, top_k) for probs in probabilities)
+
+        return predictions
+
+    def _resolve_views(self, tta):
+        """
+        Turn a TTA option into a list of (resize, hflip) views
+        """
+        if tta is None:
+            return TTA_VIEW_SETS["none"]
+        if isinstance(tta, str):
+            if tta not in TTA_VIEW_SETS:
+                raise ValueError(
+                    f"Unknown TTA view set '{tta}', expected one of {sorted(TTA_VIEW_SETS)}"
+                )
+            return TTA_VIEW_SETS[tta]
+        if not tta:
+            raise ValueError("TTA view list must not be empty")
+        return list(tta)
+
+    def _filter_wildlife(self, probabilities, top_k):
+        """
+        Filter a probability vector over ImageNet classes down to wildlife
+        """
         # Get top predictions from all ImageNet classes
-        top_probs, top_indices = torch.topk(probabilities[0], k=100)
+        top_probs, top_indices = torch.topk(probabilities, k=100)
 
         # Filter for wildlife classes and get top-k
         wildlife_predictions = []
@@ -252,7 +369,7 @@ class WildlifeRecognitionModel:
 
         # If no wildlife detected, return top general predictions
         if not wildlife_predictions:
-            return self._get_general_predictions(probabilities[0], top_k)
+            return self._get_general_predictions(probabilities, top_k)
 
         return wildlife_predictions[:top_k]
 
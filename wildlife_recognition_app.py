@@ -10,6 +10,20 @@ from PIL import Image, ImageTk
 import threading
 import os
 from siamese_network import WildlifeRecognitionModel
+from results_store import ResultsStore, default_results_dir
+
+
+# 预测结果存储目录（用户数据目录，安装目录可能只读）
+RESULTS_DIR = default_results_dir()
+
+# 结果写入磁盘的阈值：每块最多50行（约10张图像），或每30秒写入一次
+# 意外退出时最多丢失10张图像或30秒内的结果，同时避免产生过多小块
+RESULTS_CHUNK_ROWS = 50
+RESULTS_FLUSH_INTERVAL_MS = 30000
+
+# 小块累积到20个时合并为最多65536行的大块，保持块数量和manifest较小
+RESULTS_COMPACT_ROWS = 65536
+RESULTS_COMPACT_MIN_CHUNKS = 20
 
 
 class WildlifeRecognitionApp:
@@ -24,9 +38,18 @@ class WildlifeRecognitionApp:
         self.current_image_path = None
         self.current_photo = None
 
+        # 预测结果持久化存储（分块列式存储，首次保存时创建）
+        self.results_store = None
+        self._results_store_lock = threading.Lock()
+
         # 创建用户界面
         self.create_widgets()
 
+        # 定期写入缓存的预测结果，关闭窗口时写入剩余结果
+        self._flush_thread = None
+        self.root.after(RESULTS_FLUSH_INTERVAL_MS, self.flush_results)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
         # 状态
         self.update_status("就绪")
 
@@ -284,6 +307,9 @@ class WildlifeRecognitionApp:
             self.root.after(0, self.display_predictions, predictions)
             self.root.after(0, self.update_status, "预测完成！")
 
+            # 保存预测结果（保存失败不影响已显示的预测）
+            self._save_predictions(image_path, predictions)
+
         except Exception as e:
             self.root.after(0, messagebox.showerror, "错误", f"预测失败:\n{str(e)}")
             self.root.after(0, self.update_status, "预测失败")
@@ -293,6 +319,21 @@ class WildlifeRecognitionApp:
             self.root.after(0, lambda: self.upload_btn.config(state=tk.NORMAL))
             self.root.after(0, lambda: self.clear_btn.config(state=tk.NORMAL))
 
+    def _get_results_store(self):
+        """获取结果存储，首次调用时创建（创建失败时抛出异常）"""
+        with self._results_store_lock:
+            if self.results_store is None:
+                self.results_store = ResultsStore(RESULTS_DIR, chunk_size=RESULTS_CHUNK_ROWS)
+            return self.results_store
+
+    def _save_predictions(self, image_path, predictions):
+        """保存预测结果（含EXIF拍摄时间），单独报告保存错误"""
+        try:
+            self._get_results_store().append(image_path, predictions)
+        except Exception as e:
+            self.root.after(0, messagebox.showwarning, "警告", f"预测结果保存失败:\n{str(e)}")
+            self.root.after(0, self.update_status, "预测完成，但结果保存失败")
+
     def display_predictions(self, predictions):
         """显示预测结果"""
         # 启用文本框进行编辑
@@ -350,6 +391,49 @@ class WildlifeRecognitionApp:
         """更新状态栏消息"""
         self.status_label.config(text=message)
 
+    def flush_results(self):
+        """定期在后台线程中将缓存的预测结果写入磁盘"""
+        # 上一次写入尚未完成时跳过本次，避免线程堆积
+        if self._flush_thread is None or not self._flush_thread.is_alive():
+            self._flush_thread = threading.Thread(target=self._flush_worker)
+            self._flush_thread.daemon = True
+            self._flush_thread.start()
+        self.root.after(RESULTS_FLUSH_INTERVAL_MS, self.flush_results)
+
+    def _flush_worker(self):
+        """结果写入工作线程"""
+        if self.results_store is None:
+            return
+        try:
+            self.results_store.flush()
+            self.results_store.compact(target_rows=RESULTS_COMPACT_ROWS,
+                                       min_chunks=RESULTS_COMPACT_MIN_CHUNKS)
+        except Exception as e:
+            self.root.after(0, self.update_status, f"结果保存失败: {str(e)}")
+
+    def on_close(self):
+        """关闭程序前在后台线程中写入预测结果"""
+        # 隐藏窗口，写入完成后再销毁，避免界面卡住
+        self.root.withdraw()
+        thread = threading.Thread(target=self._close_worker)
+        thread.daemon = True
+        thread.start()
+
+    def _close_worker(self):
+        """关闭时的结果写入工作线程"""
+        error = None
+        try:
+            if self.results_store is not None:
+                self.results_store.close()
+        except Exception as e:
+            error = e
+        self.root.after(0, self._finish_close, error)
+
+    def _finish_close(self, error):
+        """报告写入错误并关闭窗口"""
+        if error is not None:
+            messagebox.showerror("错误", f"保存预测结果失败:\n{str(error)}")
+        self.root.destroy()
 
 def main():
     """主入口点"""